@@ -1,5 +1,6 @@
 # core/exporter.py
 
+import io
 import os
 import csv
 
@@ -11,6 +12,17 @@ def get_output_root(main_folder: str, override) -> str:
     If override is a non-empty string, use that as the root.
     Otherwise, create/use a 'Results' folder inside main_folder.
     """
+    root = output_root_path(main_folder, override)
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def output_root_path(main_folder: str, override) -> str:
+    """
+    Same choice of folder as get_output_root, without creating it. Use this
+    before a run: a 'Results' folder created ahead of the folder scan would
+    be picked up as a data subfolder.
+    """
 
     # --- SAFETY FIX: normalize override ----
     if override is None:
@@ -25,7 +37,6 @@ def get_output_root(main_folder: str, override) -> str:
         # default folder inside main folder
         root = os.path.join(main_folder, "Results")
 
-    os.makedirs(root, exist_ok=True)
     return root
 
 
@@ -43,15 +54,25 @@ def write_subfolder_summary(output_root: str,
     filename = f"{folder_name}_summary.csv"
     path = os.path.join(output_root, filename)
 
+    # Build the whole CSV in memory, then hand it to the file in one write
+    # instead of one write() per row.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["Folder", "LineName", "ExportTotal", "ImportTotal"])
+
+    # writerows drives the whole loop from C, one call instead of one per line
+    writer.writerows(
+        (
+            folder_name,
+            line_name,
+            yearly_results[line_name].get("Export", 0.0),
+            yearly_results[line_name].get("Import", 0.0),
+        )
+        for line_name in sorted(yearly_results.keys())
+    )
+
     with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Folder", "LineName", "ExportTotal", "ImportTotal"])
-
-        for line_name in sorted(yearly_results.keys()):
-            type_dict = yearly_results[line_name]
-            export_total = type_dict.get("Export", 0.0)
-            import_total = type_dict.get("Import", 0.0)
-            writer.writerow([folder_name, line_name, export_total, import_total])
+        f.write(buf.getvalue())
 
     return path
 
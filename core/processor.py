@@ -1,20 +1,59 @@
 # core/processor.py
 
 import os
+import sys
 import csv
-from collections import defaultdict
+import json
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+from itertools import chain
+from operator import itemgetter
+from sys import intern
 
 SUPPORTED_TYPES = {"export", "import"}  # what we actually sum
+FLOW_TYPES = ("Export", "Import")  # result keys, indexed by flow code
+READ_BUFFER_SIZE = 1 << 20  # 1 MiB reads; monthly CSVs often live on network shares
+CACHE_FILENAME = ".tie_cache.json"  # per-file totals kept between sessions
+CACHE_VERSION = 1  # bump when a parser change alters per-file totals
+PARALLEL_MIN_FILES = 3  # fewer files to parse than this: skip the pool
+WARMUP_WORKERS = 2  # workers started ahead of the first run; the rest on demand
 
+# lowercase flow text -> flow code (index into FLOW_TYPES)
+_FLOW_CODES = {name.lower(): code for code, name in enumerate(FLOW_TYPES)}
 
-def find_subfolders(main_folder: str):
-    """Return a list of full paths to immediate subfolders."""
-    subfolders = []
+# Exact cell text -> flow code for the usual spellings, so clean rows can
+# skip strip()/lower() entirely. The leading-space forms come from exports
+# written with ", " as the separator.
+_FLOW_CELLS = {
+    pad + variant: code
+    for lower, code in _FLOW_CODES.items()
+    for variant in (lower, lower.capitalize(), lower.upper())
+    for pad in ("", " ")
+}
+
+# csv_path -> ((st_mtime_ns, st_size), flat totals) from earlier runs
+_totals_cache = {}
+
+
+class RunCancelled(Exception):
+    """Raised when a run is stopped through its cancel event."""
+
+
+def iter_subfolders(main_folder: str):
+    """Yield full paths to immediate subfolders, in directory order."""
     with os.scandir(main_folder) as it:
         for entry in it:
             if entry.is_dir():
-                subfolders.append(entry.path)
-    return sorted(subfolders)
+                yield entry.path
+
+
+def find_subfolders(main_folder: str):
+    """Return a sorted list of full paths to immediate subfolders."""
+    return sorted(iter_subfolders(main_folder))
 
 
 def list_csv_files(folder: str):
@@ -38,59 +77,120 @@ def choose_csv_files(folder: str, prefer_updates: bool):
     If prefer_updates is False:
         - Ignore any '*_update.csv' files and use only the base files.
     """
-    all_csv = list_csv_files(folder)
+    chosen = []
+    base_map = {}  # base_root -> chosen file path
+
+    # One scandir pass, visited in name order: when two files map to the
+    # same base (feb.csv / feb.CSV, b_update.csv / b_UPDATE.csv) the
+    # sorted order decides which one wins, as it always has.
+    with os.scandir(folder) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.name[-4:].lower() != ".csv" or not entry.is_file():
+            continue
+        root = entry.name[:-4]
+        is_update = root.lower().endswith("_update")
+
+        if not prefer_updates:
+            if not is_update:
+                chosen.append(entry.path)
+        elif is_update:
+            base_map[root[:-7]] = entry.path  # strip "_update", overwrite base
+        else:
+            base_map.setdefault(root, entry.path)  # only if not already replaced
 
     if not prefer_updates:
-        chosen = []
-        for path in all_csv:
-            name = os.path.basename(path)
-            root, ext = os.path.splitext(name)
-            if root.lower().endswith("_update"):
-                continue
-            chosen.append(path)
         return chosen
+    return [base_map[k] for k in sorted(base_map.keys())]
 
-    # prefer_updates == True
-    base_map = {}  # base_root -> chosen file path
-    for path in all_csv:
-        name = os.path.basename(path)
-        root, ext = os.path.splitext(name)
-        if root.lower().endswith("_update"):
-            base_root = root[:-7]  # strip "_update"
-            base_map[base_root] = path  # overwrite base
-        else:
-            base_root = root
-            base_map.setdefault(base_root, path)  # only set if not already replaced
 
-    chosen_paths = [base_map[k] for k in sorted(base_map.keys())]
-    return chosen_paths
+def scan_main_folder(main_folder: str, prefer_updates: bool):
+    """
+    Walk main_folder once: every immediate subfolder with the CSV files
+    choose_csv_files picks for it.
+
+    Folder listings are cached per directory mtime (see _cached_subfolders),
+    so the GUI tree and the run that follows it share one walk.
+
+    Returns a list of (subfolder_path, [csv_path, ...]) in subfolder order.
+    """
+    subfolders = _cached_subfolders(main_folder, os.stat(main_folder).st_mtime_ns)
+    return [(sub, _chosen_csv_files(sub, prefer_updates)) for sub in subfolders]
+
+
+# ---------- Scan cache ----------
+# A directory's mtime changes whenever an entry is added, removed or
+# renamed in it, so (path, mtime_ns) is enough to know a listing is
+# still good. Editing a CSV in place doesn't change the listing.
+# _cached_csvs holds one entry per subfolder and is unbounded: a bounded
+# LRU smaller than the tree evicts every entry before the run, which
+# reads in the same order, gets to it. clear_scan_cache() empties it.
+
+@lru_cache(maxsize=64)
+def _cached_subfolders(main_folder: str, mtime_ns: int):
+    return tuple(find_subfolders(main_folder))
+
+
+@lru_cache(maxsize=None)
+def _cached_csvs(subfolder: str, prefer_updates: bool, mtime_ns: int):
+    return tuple(choose_csv_files(subfolder, prefer_updates=prefer_updates))
+
+
+def _chosen_csv_files(subfolder: str, prefer_updates: bool):
+    """choose_csv_files, answered from the scan cache when possible."""
+    mtime_ns = os.stat(subfolder).st_mtime_ns
+    return list(_cached_csvs(subfolder, prefer_updates, mtime_ns))
+
+
+def clear_scan_cache():
+    """
+    Forget all cached folder listings (the GUI's "Refresh tree" button).
+    Needed on filesystems with coarse mtimes, where a change made within
+    the same tick as the last scan would otherwise go unnoticed.
+    """
+    _cached_subfolders.cache_clear()
+    _cached_csvs.cache_clear()
 
 
 def _find_hour_indices(header_row):
     """
     Given a CSV header row, return list of column indices that are Hr01..Hr24.
     Matching is case-insensitive and just checks for 'hr' at the start.
+    Only the first two non-blank characters get lowercased, not the whole
+    cell (csv.reader cells are already str, and empty ones are skipped).
     """
-    hour_indices = []
-    for idx, name in enumerate(header_row):
-        if name is None:
-            continue
-        name_str = str(name).strip().lower()
-        if name_str.startswith("hr"):
-            hour_indices.append(idx)
-    return hour_indices
+    return [
+        idx
+        for idx, name in enumerate(header_row)
+        if name and name.lstrip()[:2].lower() == "hr"
+    ]
 
 
 def _locate_header_and_hours(rows):
     """
     Scan down through the rows until we find a row that contains Hr01..Hr24.
-    Returns (header_index, hour_cols). If not found, returns (-1, []).
+    rows can be a live csv.reader: it is only consumed up to the header, so
+    iterating it afterwards yields the data rows.
+    Returns (hour_cols, name_col). If not found, returns ((), None).
     """
-    for i, row in enumerate(rows):
-        hour_cols = _find_hour_indices(row)
+    for row in rows:
+        hour_cols, name_col = _header_layout(tuple(row))
         if hour_cols:
-            return i, hour_cols
-    return -1, []
+            return hour_cols, name_col
+    return (), None
+
+
+@lru_cache(maxsize=128)
+def _header_layout(header):
+    """
+    Return (hour_cols, name_col) for a row given as a tuple, or ((), None)
+    if it isn't an Hr01..Hr24 header. Cached because the monthly files in a
+    folder almost always share the same header row.
+    """
+    hour_cols = tuple(_find_hour_indices(header))
+    if not hour_cols:
+        return (), None
+    return hour_cols, _find_name_col(header)
 
 
 def _find_name_col(header_row):
@@ -112,9 +212,56 @@ def _find_name_col(header_row):
     return None
 
 
-def process_csv_file(csv_path: str):
+def _find_flow_col(row):
+    """
+    Return the index of the first cell reading Export/Import (any case or
+    padding), or None if the row has none.
+    """
+    for idx, cell in enumerate(row):
+        if cell.strip().lower() in SUPPORTED_TYPES:
+            return idx
+    return None
+
+
+def _hour_picker(hour_cols):
     """
-    Process a single monthly CSV.
+    Return a callable that takes a data row and hands back its hour cells
+    in one C-level call.
+
+    For the usual side-by-side Hr01..Hr24 block that is a slice, where a
+    short row just yields fewer cells (same as skipping the missing ones).
+    Scattered hour columns use itemgetter(*hour_cols), which raises
+    IndexError on a short row so the caller can fall back to _parse_hours.
+    """
+    first, last = hour_cols[0], hour_cols[-1]
+    if last - first + 1 == len(hour_cols):
+        return itemgetter(slice(first, last + 1))
+    return itemgetter(*hour_cols)  # 2+ columns here, so always a tuple
+
+
+def _parse_hours(row, hour_cols):
+    """
+    Slow path of the hour sum: add up the hour cells one by one, skipping
+    missing, blank and non-numeric cells.
+    """
+    total = 0.0
+    for idx in hour_cols:
+        if idx >= len(row):
+            continue
+        cell = row[idx].strip()
+        if cell == "":
+            continue
+        try:
+            total += float(cell)
+        except ValueError:
+            continue
+    return total
+
+
+def process_csv_file(csv_path: str, read_buffer_size: int = READ_BUFFER_SIZE):
+    """
+    Process a single monthly CSV, reading it read_buffer_size bytes at a
+    time.
 
     Returns:
         results: dict[line_name][flow_type] = total_sum_for_this_file
@@ -126,87 +273,118 @@ def process_csv_file(csv_path: str):
       * Line name from header column ('Name', 'Line', 'Tie') when present,
         otherwise "flow column + 2".
     """
-    results = defaultdict(lambda: defaultdict(float))
-
-    with open(csv_path, "r", newline="", encoding="utf-8-sig") as f:
-        reader = csv.reader(f)
-        all_rows = list(reader)
-
-    if not all_rows:
-        return {}
-
-    header_index, hour_cols = _locate_header_and_hours(all_rows)
-    if header_index == -1 or not hour_cols:
-        # Couldn't find a Hr01–Hr24 header row
-        return {}
-
-    header_row = all_rows[header_index]
-    name_col_idx = _find_name_col(header_row)  # may be None
-
-    data_rows = all_rows[header_index + 1 :]
+    return _to_nested(_csv_totals(csv_path, read_buffer_size))
 
-    current_line_name = ""
-    flow_col_index = None  # we will detect this dynamically from the data rows
 
-    for row in data_rows:
-        if not row:
-            continue
+def _csv_totals(csv_path: str, read_buffer_size: int = READ_BUFFER_SIZE):
+    """
+    Does the actual work for process_csv_file, but returns the flat
+    {(line_name, flow_type): total} dict so callers that keep merging
+    (process_single_subfolder) don't have to un-nest it again.
+    """
+    # Per line, one running total per flow code: [export, import]. Rows of
+    # the same line usually follow each other, so the slot is looked up
+    # only when the line name changes.
+    line_totals = {}
+    line_slot = None
+
+    with open(csv_path, "r", newline="", encoding="utf-8-sig",
+              buffering=read_buffer_size) as f:
+        if hasattr(os, "posix_fadvise"):
+            # Read front to back once: let the kernel read ahead aggressively
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
 
-        # If we don't yet know which column has Export/Import, scan this row
-        if flow_col_index is None:
-            for idx, cell in enumerate(row):
-                val = str(cell).strip().lower()
-                if val in SUPPORTED_TYPES:
-                    flow_col_index = idx
-                    break
+        # Stream the file: the header scan and the data loop share one reader,
+        # so the rows are never held in memory all at once.
+        reader = csv.reader(f)
 
-        if flow_col_index is None or flow_col_index >= len(row):
-            # still haven't seen any Export/Import yet
-            continue
+        hour_cols, name_col_idx = _locate_header_and_hours(reader)
+        if not hour_cols:
+            # Couldn't find a Hr01–Hr24 header row
+            return {}
 
-        flow_type = str(row[flow_col_index]).strip()
-        if not flow_type:
-            continue
+        pick_hours = _hour_picker(hour_cols)
 
-        flow_type_lower = flow_type.lower()
-        if flow_type_lower not in SUPPORTED_TYPES:
-            # Ignore Net or anything else
-            continue
-
-        # Determine which column holds the line/tie name
-        line_name_cell = ""
-        if name_col_idx is not None and name_col_idx < len(row):
-            # Preferred: explicit Name/Line/Tie column from header
-            line_name_cell = str(row[name_col_idx]).strip()
+        # The first data row with an Export/Import cell decides which column
+        # holds the flow type; rows before it have nothing we can sum.
+        for row in reader:
+            flow_col_index = _find_flow_col(row)
+            if flow_col_index is not None:
+                break
         else:
-            # Fallback: two columns to the right of flow-type column
-            line_name_idx = flow_col_index + 2
-            if line_name_idx < len(row):
-                line_name_cell = str(row[line_name_idx]).strip()
+            return {}
 
-        if line_name_cell:
-            current_line_name = line_name_cell
+        # Resolve the name column once per file. The fallback sits two
+        # columns right of the flow type; without a Name/Line/Tie header
+        # it is the only candidate.
+        fallback_name_col = flow_col_index + 2
+        if name_col_idx is None:
+            name_col_idx = fallback_name_col
 
-        if not current_line_name:
-            # Can't group without a name
-            continue
+        current_line_name = ""
 
-        # Sum Hr01..Hr24
-        total_for_row = 0.0
-        for idx in hour_cols:
-            if idx >= len(row):
+        for row in chain((row,), reader):
+            if flow_col_index >= len(row):
+                # blank or short row
                 continue
-            cell = str(row[idx]).strip()
-            if cell == "":
+
+            flow_cell = row[flow_col_index]
+            flow_code = _FLOW_CELLS.get(flow_cell)
+            if flow_code is None:
+                # Odd spacing/casing: normalise before giving up
+                flow_code = _FLOW_CODES.get(flow_cell.strip().lower())
+                if flow_code is None:
+                    # Ignore Net, blanks or anything else
+                    continue
+
+            # Determine which column holds the line/tie name
+            line_name_cell = ""
+            if name_col_idx < len(row):
+                # Preferred: explicit Name/Line/Tie column from header
+                line_name_cell = row[name_col_idx].strip()
+            elif fallback_name_col < len(row):
+                # Fallback: two columns to the right of flow-type column
+                line_name_cell = row[fallback_name_col].strip()
+
+            if line_name_cell and line_name_cell != current_line_name:
+                # Interned: one str per tie name across all monthly files
+                current_line_name = intern(line_name_cell)
+                line_slot = line_totals.get(current_line_name)
+                if line_slot is None:
+                    line_slot = line_totals[current_line_name] = [0.0, 0.0]
+
+            if not current_line_name:
+                # Can't group without a name
                 continue
+
+            # Sum Hr01..Hr24. Clean rows (blank cells included) go through
+            # map(float, ...) in one C-level pass; rows with text in an hour
+            # cell, or too short for scattered hour columns, take the
+            # forgiving per-cell loop.
             try:
-                total_for_row += float(cell)
-            except ValueError:
-                continue
+                line_slot[flow_code] += sum(map(float, filter(None, pick_hours(row))))
+            except (ValueError, IndexError):
+                line_slot[flow_code] += _parse_hours(row, hour_cols)
 
-        results[current_line_name][flow_type.capitalize()] += total_for_row
+    return {
+        (line_name, flow_type): slot[code]
+        for line_name, slot in line_totals.items()
+        for code, flow_type in enumerate(FLOW_TYPES)
+    }
 
-    return results
+
+def _to_nested(flat):
+    """
+    Turn a flat {(line_name, flow_type): value} dict into the
+    dict[line_name][flow_type] = value shape the rest of the tool uses.
+    """
+    nested = {}
+    for (line_name, flow_type), value in flat.items():
+        nested.setdefault(line_name, {})[flow_type] = value
+    return nested
 
 
 def merge_results(list_of_results):
@@ -216,12 +394,29 @@ def merge_results(list_of_results):
     Input:  [dict[line][type] = value, ...]
     Output: dict[line][type] = yearly_total
     """
-    yearly = defaultdict(lambda: defaultdict(float))
-    for res in list_of_results:
-        for line_name, type_dict in res.items():
-            for flow_type, value in type_dict.items():
-                yearly[line_name][flow_type] += value
-    return yearly
+    flat_results = (
+        {
+            (line_name, flow_type): value
+            for line_name, type_dict in res.items()
+            for flow_type, value in type_dict.items()
+        }
+        for res in list_of_results
+    )
+    return _to_nested(_merge_totals(flat_results))
+
+
+def _merge_totals(list_of_totals):
+    """
+    Sum flat {(line_name, flow_type): value} dicts into one flat dict.
+    """
+    merged = {}
+    for totals in list_of_totals:
+        if not merged:
+            merged.update(totals)  # first non-empty file: plain C-level copy
+            continue
+        for key, value in totals.items():
+            merged[key] = merged.get(key, 0.0) + value
+    return merged
 
 
 def format_results_as_text(yearly_results, folder_label: str):
@@ -248,14 +443,38 @@ def format_results_as_text(yearly_results, folder_label: str):
 
 def process_single_subfolder(subfolder_path: str,
                              dry_run: bool = True,
-                             prefer_updates: bool = True):
+                             prefer_updates: bool = True,
+                             max_workers=None,
+                             progress=None,
+                             read_buffer_size: int = READ_BUFFER_SIZE,
+                             cancel=None):
     """
     Process one monthly folder (e.g. SCPSAMonthly).
 
+    The monthly files are parsed in parallel on the shared process pool
+    (see _map_csv_totals); max_workers=1 parses them one after another.
+    progress(files_done, files_total) is called as files finish, if given.
+    read_buffer_size is the read size per CSV (see process_csv_file).
+    cancel (optional, e.g. a threading.Event) stops the run between files
+    once set, by raising RunCancelled.
+
+    Returns a tuple (log_text, yearly_results_dict).
+    """
+    csv_files = _chosen_csv_files(subfolder_path, prefer_updates)
+    monthly_totals = _map_csv_totals(csv_files, max_workers, progress,
+                                     read_buffer_size, cancel)
+    return _subfolder_report(subfolder_path, csv_files, monthly_totals,
+                             dry_run, prefer_updates)
+
+
+def _subfolder_report(subfolder_path, csv_files, monthly_totals,
+                      dry_run, prefer_updates):
+    """
+    Merge the per-file totals of one subfolder and build its log block.
+
     Returns a tuple (log_text, yearly_results_dict).
     """
     folder_name = os.path.basename(subfolder_path.rstrip("/\\"))
-    csv_files = choose_csv_files(subfolder_path, prefer_updates=prefer_updates)
 
     log_lines = [
         f"Processing subfolder: {folder_name}",
@@ -265,17 +484,15 @@ def process_single_subfolder(subfolder_path: str,
     for p in csv_files:
         log_lines.append(f"   - {os.path.basename(p)}")
 
-    monthly_results = []
-    for csv_path in csv_files:
-        res = process_csv_file(csv_path)
-        if not res:
+    for csv_path, totals in zip(csv_files, monthly_totals):
+        if not totals:
             log_lines.append(
                 f"   ! No Hr01–Hr24 header or no Export/Import rows found in: "
                 f"{os.path.basename(csv_path)}"
             )
-        monthly_results.append(res)
 
-    yearly = merge_results(monthly_results)
+    # Merge the flat per-file totals, nest once for the caller
+    yearly = _to_nested(_merge_totals(monthly_totals))
     log_lines.append("")
     log_lines.append(format_results_as_text(yearly, folder_name))
 
@@ -287,38 +504,302 @@ def process_single_subfolder(subfolder_path: str,
 
 def process_all_subfolders(main_folder: str,
                            dry_run: bool = True,
-                           prefer_updates: bool = True):
+                           prefer_updates: bool = True,
+                           max_workers=None,
+                           cache_path=None,
+                           progress=None,
+                           log=None,
+                           read_buffer_size: int = READ_BUFFER_SIZE,
+                           cancel=None):
     """
     Process all immediate subfolders under main_folder.
 
+    Every monthly file of every subfolder goes into one batch on the shared
+    process pool (max_workers processes, default = default_workers(); see
+    _get_pool), so a folder with 12 files and a folder with 2 keep the same
+    number of workers busy. max_workers=1 keeps the old serial behaviour.
+    Results and logs stay in subfolder order.
+
+    cache_path (optional) is a JSON file of per-file totals from earlier
+    sessions (see load_totals_cache); unchanged CSVs listed there are not
+    parsed again. It is only rewritten when dry_run is False.
+
+    progress(files_done, files_total) is called as files finish, if given.
+
+    log(text), if given, receives the log as it is produced: one piece per
+    subfolder, as soon as that subfolder's files are parsed. Joined with
+    "\n" the pieces make up the whole log; they are not kept, and the
+    returned log_text is None.
+
+    read_buffer_size is the read size per CSV (see process_csv_file).
+
+    cancel (optional, e.g. a threading.Event) stops the run between files
+    once set, by raising RunCancelled. Nothing is written in that case,
+    not even the totals cache.
+
     Returns:
         log_text (str), all_yearly (dict[subfolder_name] = yearly_results_dict)
     """
-    subfolders = find_subfolders(main_folder)
-    if not subfolders:
-        return f"No subfolders found inside: {main_folder}", {}
+    plan = scan_main_folder(main_folder, prefer_updates)
+    if not plan:
+        log_text = f"No subfolders found inside: {main_folder}"
+        if log is not None:
+            log(log_text)
+            return None, {}
+        return log_text, {}
 
     all_logs = [
         f"Main folder: {main_folder}",
-        f"Found {len(subfolders)} subfolders.",
+        f"Found {len(plan)} subfolders.",
         f"Prefer updates: {prefer_updates}",
         "",
     ]
 
     all_yearly = {}
 
-    for sub in subfolders:
-        folder_name = os.path.basename(sub.rstrip("/\\"))
-        log_text, yearly = process_single_subfolder(
-            sub, dry_run=dry_run, prefer_updates=prefer_updates
+    all_files = [p for _, csv_files in plan for p in csv_files]
+    if cache_path:
+        load_totals_cache(cache_path)
+    # Totals arrive in file order, so each subfolder can be reported as
+    # soon as its own files are done
+    all_totals = _iter_csv_totals(all_files, max_workers, progress,
+                                  read_buffer_size, cancel)
+
+    for sub, csv_files in plan:
+        monthly_totals = [next(all_totals) for _ in csv_files]
+        log_text, yearly = _subfolder_report(
+            sub, csv_files, monthly_totals, dry_run, prefer_updates
         )
+        folder_name = os.path.basename(sub.rstrip("/\\"))
         all_logs.append(log_text)
         all_logs.append("-" * 60)
         all_yearly[folder_name] = yearly
+        if log is not None:
+            # Hand the piece over instead of holding the whole run's log
+            log("\n".join(all_logs))
+            all_logs.clear()
+
+    if cancel is not None and cancel.is_set():
+        raise RunCancelled()  # set after the last file: still write nothing
+    if cache_path and not dry_run:
+        save_totals_cache(cache_path, all_files)
 
     if dry_run:
         all_logs.append("Dry run complete for ALL subfolders. No files written.")
     else:
         all_logs.append("Processing complete for ALL subfolders.")
+    if log is not None:
+        log("\n".join(all_logs))
+        return None, all_yearly
 
     return "\n".join(all_logs), all_yearly
+
+
+def _map_csv_totals(csv_files, max_workers=None, progress=None,
+                    read_buffer_size=READ_BUFFER_SIZE, cancel=None):
+    """
+    Run _csv_totals over csv_files and return the results in the same order.
+
+    Files whose size and mtime haven't changed since an earlier run in this
+    session come straight from _totals_cache (GUI re-clicks, switching
+    between single and all modes). The rest go to the shared process pool
+    when there are at least PARALLEL_MIN_FILES of them and more than one
+    worker allowed (max_workers, default = default_workers()); for one or two files
+    pickling the results back costs more than it saves.
+
+    progress, if given, is called as progress(files_done, files_total)
+    each time a file's totals are in.
+    """
+    return list(_iter_csv_totals(csv_files, max_workers, progress,
+                                 read_buffer_size, cancel))
+
+
+def _iter_csv_totals(csv_files, max_workers=None, progress=None,
+                     read_buffer_size=READ_BUFFER_SIZE, cancel=None):
+    """
+    Generator form of _map_csv_totals: yields each file's totals in
+    csv_files order, as soon as that file (and every one before it) is
+    done, while the pool keeps working on the rest.
+
+    Raises RunCancelled before the next file once cancel.is_set().
+    """
+    if max_workers is None:
+        max_workers = default_workers()
+
+    stamps = {}
+    todo = []
+    for csv_path in csv_files:
+        st = os.stat(csv_path)
+        stamps[csv_path] = (st.st_mtime_ns, st.st_size)
+        cached = _totals_cache.get(csv_path)
+        if cached is None or cached[0] != stamps[csv_path]:
+            todo.append(csv_path)
+
+    parse = partial(_csv_totals, read_buffer_size=read_buffer_size)
+    futures = {}  # csv_path -> Future, when the pool is used
+    if max_workers > 1 and len(todo) >= PARALLEL_MIN_FILES:
+        pool = _get_pool(max_workers)
+        futures = {csv_path: pool.submit(parse, csv_path) for csv_path in todo}
+
+    stale = set(todo)
+    done = len(csv_files) - len(todo)
+    try:
+        for csv_path in csv_files:
+            if cancel is not None and cancel.is_set():
+                raise RunCancelled()
+            if csv_path in stale:
+                future = futures.get(csv_path)
+                totals = parse(csv_path) if future is None else future.result()
+                _totals_cache[csv_path] = (stamps[csv_path], totals)
+                done += 1
+                if progress is not None:
+                    progress(done, len(csv_files))
+            yield _totals_cache[csv_path][1]
+    except BrokenProcessPool:
+        # A worker died; don't hand the dead pool to the next run
+        shutdown_pool()
+        raise
+    finally:
+        # Cancelled, failed or abandoned: drop the files not started yet,
+        # so the next run doesn't queue behind them
+        for future in futures.values():
+            future.cancel()
+
+
+def load_totals_cache(cache_path: str):
+    """
+    Seed the per-file totals cache from a file written by save_totals_cache.
+
+    Entries already cached in this session win. A missing or unreadable
+    cache file, or one written for another CACHE_VERSION, is ignored: the
+    CSVs just get parsed again.
+    """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") != CACHE_VERSION:
+            return
+        for csv_path, entry in saved["files"].items():
+            if csv_path in _totals_cache:
+                continue
+            stamp = (entry["mtime_ns"], entry["size"])
+            totals = {(line, flow): value for line, flow, value in entry["totals"]}
+            _totals_cache[csv_path] = (stamp, totals)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return
+
+
+def save_totals_cache(cache_path: str, csv_files):
+    """
+    Write the cached totals of csv_files to cache_path as JSON.
+
+    Written to a temp file first and then swapped in, so an interrupted
+    run can't leave a half-written cache behind. The folder is created
+    here if needed, i.e. only once a run has parsed everything.
+
+    Like loading, saving is best effort: if the cache can't be written
+    (read-only share, file held open by another user) it is skipped and
+    the run carries on.
+    """
+    saved = {}
+    for csv_path in csv_files:
+        cached = _totals_cache.get(csv_path)
+        if cached is None:
+            continue
+        (mtime_ns, size), totals = cached
+        saved[csv_path] = {
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "totals": [[line, flow, value] for (line, flow), value in totals.items()],
+        }
+
+    tmp_path = cache_path + ".tmp"
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": saved}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+# ---------- Worker pool ----------
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.RLock()  # warmup() may run on its own thread
+
+# ProcessPoolExecutor refuses more workers than this on Windows
+WINDOWS_MAX_WORKERS = 61
+
+
+def default_workers():
+    """
+    Largest useful pool size: one worker per CPU, capped at what
+    ProcessPoolExecutor accepts on this platform.
+    """
+    workers = os.cpu_count() or 1
+    if sys.platform == "win32":
+        workers = min(workers, WINDOWS_MAX_WORKERS)
+    return workers
+
+
+def _get_pool(max_workers: int):
+    """
+    Return the shared process pool, (re)creating it if the size changed.
+
+    The pool outlives a single run: starting worker processes costs
+    50-200 ms each on Windows, and warm workers keep their header cache
+    between runs from the GUI. Workers are always spawned, never forked:
+    warmup() creates the pool from a background thread, and forking a
+    process that has threads running is unsafe.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            shutdown_pool()
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def warmup(max_workers=None):
+    """
+    Start the first WARMUP_WORKERS shared worker processes ahead of the
+    first run, so the first click doesn't pay for spawning them. Returns
+    without waiting for them.
+    max_workers works as in _map_csv_totals.
+    """
+    if max_workers is None:
+        max_workers = default_workers()
+    if max_workers > 1:
+        # Spawned pools start one worker per queued task, up to max_workers;
+        # a run starts any others it needs. Held lock: a run can't resize
+        # (shut down) the pool between the submits.
+        with _pool_lock:
+            pool = _get_pool(max_workers)
+            for _ in range(min(max_workers, WARMUP_WORKERS)):
+                pool.submit(int)
+
+
+def shutdown_pool():
+    """
+    Stop the shared worker processes (also called at interpreter exit).
+    Files still queued from a cancelled run are dropped, not parsed.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
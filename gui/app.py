@@ -1,26 +1,92 @@
 # app.py
 
+import io
 import os
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
 from core import processor, exporter  # core package must contain __init__.py
+from gui.folder_picker import FolderPickerDialog
+
+
+def _log_tag(line: str):
+    """Return the color tag for one log line, or None."""
+    tag = None
+    if line.startswith("====="):
+        tag = "header"
+    elif line.startswith("   !") or "No Hr01–Hr24" in line:
+        tag = "warning"
+    elif line.startswith("Line:"):
+        tag = "line"
+    elif line.startswith("Dry run") or "complete" in line:
+        tag = "status"
+    return tag
 
 
 class TieDataApp(tk.Tk):
+    # The log window keeps only this many lines; the full log stays in
+    # _log_buffer for Save Log.
+    LOG_MAX_LINES = 20000
+    # How often the Tk thread drains what the worker thread posted
+    UI_POLL_MS = 50
+    # Most messages applied per drain; the rest wait for the next tick so a
+    # burst from the worker can't hold up the Tk thread
+    UI_BATCH_MAX = 256
+    # Read sizes offered for the CSV files (label -> bytes); bigger suits
+    # network shares and spinning disks
+    READ_BUFFER_CHOICES = {"64K": 64 << 10, "256K": 256 << 10, "1M": 1 << 20}
+    # Seconds after a validation popup closes during which another is skipped
+    DIALOG_MIN_INTERVAL = 0.5
+
     def __init__(self):
         super().__init__()
+        # Hidden while the widgets are built: one layout pass when shown
+        self.withdraw()
         self.title("Tie List Processor v2.0")
         self.geometry("1150x680")
+        self.minsize(900, 500)
 
         self.main_folder_var = tk.StringVar()
         self.output_folder_var = tk.StringVar()
         self.dry_run_var = tk.BooleanVar(value=True)
         self.prefer_updates_var = tk.BooleanVar(value=True)
         self.mode_var = tk.StringVar(value="single")  # 'single' or 'all'
+        # parser processes, 1..processor.default_workers()
+        self.workers_var = tk.IntVar(value=processor.default_workers())
+        self.read_buffer_var = tk.StringVar(value="1M")  # READ_BUFFER_CHOICES key
         self.status_var = tk.StringVar(value="Idle")
 
+        # Runs happen on a worker thread; it talks to the Tk thread only
+        # through this queue (see _drain_ui_queue).
+        self._ui_queue = queue.Queue()
+        self._worker = None
+        self._cancel = threading.Event()  # set by Cancel / closing the window
+        self._closing = False  # window close requested while a run was active
+
+        # Full log text (what Save Log writes), plus the blocks appended
+        # since the last redraw; _flush_log moves those into the widget in
+        # one insert.
+        self._log_buffer = io.StringIO()
+        self._log_pending = []
+
+        # Tree node id of a subfolder not expanded yet -> its CSV paths
+        # (see _on_tree_open)
+        self._tree_pending = {}
+
+        self._last_dialog_ts = 0.0  # time.monotonic() when _dialog last closed
+
         self._build_gui()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.deiconify()
+
+        # Spawn a couple of parser processes while the user is still
+        # picking folders
+        threading.Thread(
+            target=processor.warmup, args=(self.workers_var.get(),), daemon=True
+        ).start()
 
     # ---------- GUI layout ----------
 
@@ -102,16 +168,43 @@ class TieDataApp(tk.Tk):
             value="all",
         ).pack(side="left", padx=(5, 0))
 
+        workers_frame = ttk.Frame(opt_frame)
+        workers_frame.grid(row=0, column=3, padx=(30, 0), sticky="e")
+
+        ttk.Label(workers_frame, text="Workers:").pack(side="left")
+        ttk.Spinbox(
+            workers_frame,
+            from_=1,
+            to=processor.default_workers(),
+            width=4,
+            textvariable=self.workers_var,
+        ).pack(side="left", padx=(5, 0))
+
+        ttk.Label(workers_frame, text="Read buffer:").pack(side="left", padx=(15, 0))
+        ttk.Combobox(
+            workers_frame,
+            values=list(self.READ_BUFFER_CHOICES),
+            width=5,
+            state="readonly",
+            textvariable=self.read_buffer_var,
+        ).pack(side="left", padx=(5, 0))
+
         # Run / log buttons
         btn_frame = ttk.Frame(self)
         btn_frame.pack(fill="x", padx=10, pady=(0, 5))
 
-        ttk.Button(
+        self.run_button = ttk.Button(
             btn_frame,
             text="Run Processing",
             style="Run.TButton",
             command=self.run_processing,
-        ).pack(side="left")
+        )
+        self.run_button.pack(side="left")
+
+        self.cancel_button = ttk.Button(
+            btn_frame, text="Cancel", command=self.cancel_run, state="disabled"
+        )
+        self.cancel_button.pack(side="left", padx=(5, 0))
 
         ttk.Button(btn_frame, text="Save Log...", command=self.save_log).pack(
             side="right"
@@ -134,6 +227,7 @@ class TieDataApp(tk.Tk):
 
         self.folder_tree = ttk.Treeview(tree_frame, show="tree", height=26)
         self.folder_tree.pack(side="left", fill="y")
+        self.folder_tree.bind("<<TreeviewOpen>>", self._on_tree_open)
 
         tree_scroll = ttk.Scrollbar(
             tree_frame, orient="vertical", command=self.folder_tree.yview
@@ -150,11 +244,11 @@ class TieDataApp(tk.Tk):
         self.log_text = tk.Text(log_frame, wrap="none")
         self.log_text.pack(side="left", fill="both", expand=True)
 
-        y_scroll = ttk.Scrollbar(
+        self.y_scroll = ttk.Scrollbar(
             log_frame, orient="vertical", command=self.log_text.yview
         )
-        y_scroll.pack(side="right", fill="y")
-        self.log_text.configure(yscrollcommand=y_scroll.set)
+        self.y_scroll.pack(side="right", fill="y")
+        self.log_text.configure(yscrollcommand=self.y_scroll.set)
 
         x_scroll = ttk.Scrollbar(
             self, orient="horizontal", command=self.log_text.xview
@@ -189,7 +283,7 @@ class TieDataApp(tk.Tk):
         folder = filedialog.askdirectory(title="Select DataForTieList folder")
         if folder:
             self.main_folder_var.set(folder)
-            self.refresh_tree()
+            self.refresh_tree(use_cache=True)
 
     def browse_output_folder(self):
         folder = filedialog.askdirectory(title="Select output folder for summaries")
@@ -205,35 +299,70 @@ class TieDataApp(tk.Tk):
     def _get_main_folder_checked(self):
         folder = self._get_main_folder_if_exists()
         if folder is None:
-            messagebox.showwarning("Missing folder", "Please select a valid main folder.")
+            self._dialog("showwarning", "Missing folder",
+                         "Please select a valid main folder.")
         return folder
 
+    def _dialog(self, kind: str, title: str, message: str):
+        # For popups that answer a button click (kind = messagebox function
+        # name): a click repeated right after closing one doesn't open
+        # another. Run errors and save results still use messagebox directly.
+        if time.monotonic() - self._last_dialog_ts < self.DIALOG_MIN_INTERVAL:
+            return
+        getattr(messagebox, kind)(title, message)
+        self._last_dialog_ts = time.monotonic()
+
     def clear_log(self):
+        self._log_buffer = io.StringIO()
+        self._log_pending.clear()
         self.log_text.delete("1.0", tk.END)
 
     def append_log(self, text: str):
-        # Color-coded insertion line by line
-        for line in text.splitlines():
-            tag = None
-            if line.startswith("====="):
-                tag = "header"
-            elif line.startswith("   !") or "No Hr01–Hr24" in line:
-                tag = "warning"
-            elif line.startswith("Line:"):
-                tag = "line"
-            elif line.startswith("Dry run") or "complete" in line:
-                tag = "status"
+        # Record the block now, draw it on the next idle callback: appends
+        # made in the same event (or the same queue drain) share one insert.
+        lines = text.splitlines()
+        if not lines:
+            return
+
+        self._log_buffer.write("\n".join(lines) + "\n")
+        if not self._log_pending:
+            self.after_idle(self._flush_log)
+        self._log_pending.extend(lines)
 
+    def _flush_log(self):
+        # One insert for everything pending, then color the lines that need it
+        lines = self._log_pending
+        if not lines:
+            return  # cleared before we got here
+        self._log_pending = []
+
+        # Follow new output only if the view is already at the bottom; don't
+        # yank it away from a line the user scrolled up to read
+        follow = self.y_scroll.get()[1] >= 0.999
+
+        first_line = int(self.log_text.index("end-1c").split(".")[0])
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+
+        for offset, line in enumerate(lines):
+            tag = _log_tag(line)
             if tag:
-                self.log_text.insert(tk.END, line + "\n", tag)
-            else:
-                self.log_text.insert(tk.END, line + "\n")
-        self.log_text.see(tk.END)
+                n = first_line + offset
+                self.log_text.tag_add(tag, f"{n}.0", f"{n + 1}.0")
+
+        # Drop the oldest lines past LOG_MAX_LINES (the widget gets slower
+        # the more text and tags it holds); _log_buffer keeps them.
+        last_line = first_line + len(lines) - 1
+        if last_line > self.LOG_MAX_LINES:
+            self.log_text.delete("1.0", f"{last_line - self.LOG_MAX_LINES + 1}.0")
+        if follow:
+            self.log_text.see(tk.END)
 
     def save_log(self):
-        content = self.log_text.get("1.0", tk.END).strip()
+        # From the in-memory copy: no round trip through Tcl for the whole
+        # widget text, and lines trimmed from the window are still saved.
+        content = self._log_buffer.getvalue().strip()
         if not content:
-            messagebox.showinfo("Save Log", "Log is empty, nothing to save.")
+            self._dialog("showinfo", "Save Log", "Log is empty, nothing to save.")
             return
 
         path = filedialog.asksaveasfilename(
@@ -251,11 +380,14 @@ class TieDataApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("Save Log", f"Failed to save log:\n{e}")
 
-    def refresh_tree(self):
+    def refresh_tree(self, use_cache: bool = False):
+        # Folder listings come from the processor's scan cache, which the
+        # next run reuses too. use_cache=False (Refresh button) drops it
+        # and rescans from disk.
         folder = self._get_main_folder_if_exists()
         # Clear tree either way
-        for item in self.folder_tree.get_children():
-            self.folder_tree.delete(item)
+        self.folder_tree.delete(*self.folder_tree.get_children())
+        self._tree_pending.clear()
 
         if not folder:
             return
@@ -263,72 +395,213 @@ class TieDataApp(tk.Tk):
         root_label = os.path.basename(folder.rstrip("/\\")) or folder
         root_id = self.folder_tree.insert("", "end", text=root_label, open=True)
 
-        prefer_updates = self.prefer_updates_var.get()
-        subfolders = processor.find_subfolders(folder)
-        for sub in subfolders:
+        if not use_cache:
+            processor.clear_scan_cache()
+        scan = processor.scan_main_folder(folder, self.prefer_updates_var.get())
+
+        for sub, csv_files in scan:
             sub_name = os.path.basename(sub.rstrip("/\\"))
             sub_id = self.folder_tree.insert(root_id, "end", text=sub_name, open=False)
 
-            csv_files = processor.choose_csv_files(sub, prefer_updates=prefer_updates)
-            for p in csv_files:
-                self.folder_tree.insert(
-                    sub_id, "end", text=os.path.basename(p), open=False
-                )
+            # File rows are only inserted when the subfolder is expanded;
+            # until then one empty child keeps the expand arrow showing.
+            if csv_files:
+                self.folder_tree.insert(sub_id, "end", text="")
+                self._tree_pending[sub_id] = csv_files
 
         self.folder_tree.item(root_id, open=True)
 
+    def _on_tree_open(self, event=None):
+        sub_id = self.folder_tree.focus()
+        csv_files = self._tree_pending.pop(sub_id, None)
+        if csv_files is None:
+            return  # root, or already filled in
+
+        self.folder_tree.delete(*self.folder_tree.get_children(sub_id))
+        for p in csv_files:
+            self.folder_tree.insert(
+                sub_id, "end", text=os.path.basename(p), open=False
+            )
+
     def on_options_changed(self):
         # Only thing that really needs a visual refresh is the tree
-        self.refresh_tree()
+        self.refresh_tree(use_cache=True)
 
     # ---------- Actions ----------
 
     def run_processing(self):
+        if self._worker is not None:
+            return  # a run is already in flight
+
         main_folder = self._get_main_folder_checked()
         if not main_folder:
             return
 
+        # Read every Tk variable here: the worker thread must not touch Tk
         dry = self.dry_run_var.get()
         prefer_updates = self.prefer_updates_var.get()
         mode = self.mode_var.get()
+        output_override = self.output_folder_var.get()
+        try:
+            max_workers = self.workers_var.get()
+        except tk.TclError:
+            self._dialog("showwarning", "Workers", "Workers must be a whole number.")
+            return
+        # Typed values bypass the spinbox range: more processes than CPUs
+        # doesn't help, and Windows refuses more than 61
+        max_workers = min(max(1, max_workers), processor.default_workers())
+        read_buffer_size = self.READ_BUFFER_CHOICES[self.read_buffer_var.get()]
+
+        if mode == "single":
+            test_folder = self._ask_test_folder(main_folder)
+            if not test_folder:
+                return
+            job = self.run_single_folder
+            args = (main_folder, test_folder, dry, prefer_updates,
+                    output_override, max_workers, read_buffer_size)
+        else:
+            job = self.run_all_folders
+            args = (main_folder, dry, prefer_updates, output_override,
+                    max_workers, read_buffer_size)
 
         self.status_var.set("Running...")
         self.progress["value"] = 0
-        self.update_idletasks()
+        self.run_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self._cancel.clear()
 
-        try:
-            if mode == "single":
-                self.run_single_folder(main_folder, dry, prefer_updates)
-            else:
-                self.run_all_folders(main_folder, dry, prefer_updates)
-
-            self.progress["value"] = 100
-            if dry:
-                self.status_var.set("Done (dry run, no files written)")
-            else:
-                self.status_var.set("Done (processing + CSV summaries)")
-        except Exception as e:
-            self.status_var.set("Error during run")
-            messagebox.showerror("Error", f"An error occurred:\n{e}")
+        self._worker = threading.Thread(
+            target=self._run_worker, args=(job, args, dry), daemon=True
+        )
+        self._worker.start()
+        self.after(self.UI_POLL_MS, self._drain_ui_queue)
 
-    def run_single_folder(self, main_folder: str, dry: bool, prefer_updates: bool):
+    def cancel_run(self):
+        # The worker stops before its next file; nothing gets written
+        if self._worker is None:
+            return
+        self._cancel.set()
+        self.status_var.set("Cancelling...")
+        self.cancel_button.configure(state="disabled")
+
+    def on_close(self):
+        # Stop a running job, but let the worker report back before the
+        # window goes: killing it mid-export would leave half the summaries.
+        # A second close doesn't wait: a worker stuck on a hung share may
+        # never report, and it's a daemon thread.
+        self._cancel.set()
+        if self._worker is None or self._closing:
+            self.destroy()
+            return
+        self._closing = True
+        self.status_var.set("Closing once the run has stopped...")
+        self.cancel_button.configure(state="disabled")
+
+    def _ask_test_folder(self, main_folder: str):
         # Let the user pick ONE subfolder
-        subfolders = processor.find_subfolders(main_folder)
-        if not subfolders:
-            messagebox.showerror(
-                "No subfolders", "No secondary folders were found under the main one."
+        if not self._has_any_subfolder(main_folder):
+            self._dialog(
+                "showerror", "No subfolders",
+                "No secondary folders were found under the main one.",
             )
-            return
+            return None
 
-        test_folder = filedialog.askdirectory(
-            title="Select ONE secondary folder to test", initialdir=main_folder
+        # Lists folders only as they're expanded: the native dialog reads
+        # all of main_folder first, which is slow on big network shares
+        test_folder = FolderPickerDialog.ask(
+            self, "Select ONE secondary folder to test", initialdir=main_folder
         )
-        if not test_folder:
-            return
+        return test_folder or None
+
+    def _has_any_subfolder(self, folder: str):
+        # Stops at the first subfolder instead of listing them all
+        return next(processor.iter_subfolders(folder), None) is not None
 
+    # ---------- Worker thread ----------
+
+    def _run_worker(self, job, args, dry: bool):
+        # Runs on the worker thread: report back only through the queue
+        try:
+            job(*args)
+        except processor.RunCancelled:
+            self._ui_queue.put(("cancelled",))
+        except Exception as e:
+            self._ui_queue.put(("error", e))
+        else:
+            self._ui_queue.put(("done", dry))
+
+    def _stop_if_cancelled(self):
+        # Worker thread: last check before any summary gets written
+        if self._cancel.is_set():
+            raise processor.RunCancelled()
+
+    def _post_log(self, text: str):
+        self._ui_queue.put(("log", text))
+
+    def _post_progress(self, done: int, total: int):
+        self._ui_queue.put(("progress", done, total))
+
+    def _drain_ui_queue(self):
+        # Tk thread: apply what the worker posted since the last tick. Log
+        # blocks share one widget insert (append_log batches them) and only
+        # the newest progress value is drawn.
+        finished = False
+        progress = None
+        for _ in range(self.UI_BATCH_MAX):
+            try:
+                msg = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            kind = msg[0]
+            if kind == "log":
+                self.append_log(msg[1])
+            elif kind == "progress":
+                progress = msg
+            elif kind == "done":
+                finished = True
+                self.progress["value"] = 100
+                if msg[1]:
+                    self.status_var.set("Done (dry run, no files written)")
+                else:
+                    self.status_var.set("Done (processing + CSV summaries)")
+            elif kind == "cancelled":
+                finished = True
+                self.status_var.set("Cancelled (no files written)")
+                self.append_log("Run cancelled: no files were written.\n")
+            elif kind == "error":
+                finished = True
+                self.status_var.set("Error during run")
+                if not self._closing:
+                    messagebox.showerror("Error", f"An error occurred:\n{msg[1]}")
+
+        if progress is not None and not finished:
+            done, total = progress[1], progress[2]
+            self.progress["value"] = 100 * done / total if total else 100
+
+        # Redraw once per busy tick (this also runs the pending _flush_log),
+        # not whenever Tk gets round to its idle queue between bursts.
+        # Never update() here: that would re-enter the event loop.
+        if progress is not None or self._log_pending:
+            self.update_idletasks()
+
+        if finished:
+            self._worker = None
+            if self._closing:
+                self.destroy()
+                return
+            self.run_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+        else:
+            self.after(self.UI_POLL_MS, self._drain_ui_queue)
+
+    def run_single_folder(self, main_folder: str, test_folder: str, dry: bool,
+                          prefer_updates: bool, output_override: str,
+                          max_workers: int, read_buffer_size: int):
+        # Worker thread: log through _post_log, never append_log
         folder_name = os.path.basename(test_folder.rstrip("/\\"))
 
-        self.append_log(
+        self._post_log(
             f"=== TEST RUN on single subfolder ===\n"
             f"Dry run = {dry}\n"
             f"Prefer updates = {prefer_updates}\n"
@@ -336,41 +609,57 @@ class TieDataApp(tk.Tk):
         )
 
         log_text, yearly = processor.process_single_subfolder(
-            test_folder, dry_run=dry, prefer_updates=prefer_updates
+            test_folder, dry_run=dry, prefer_updates=prefer_updates,
+            max_workers=max_workers, progress=self._post_progress,
+            read_buffer_size=read_buffer_size, cancel=self._cancel,
         )
-        self.append_log(log_text)
+        self._post_log(log_text)
 
         # CSV export
         if not dry:
-            output_root = exporter.get_output_root(
-                main_folder, self.output_folder_var.get()
-            )
+            self._stop_if_cancelled()
+            output_root = exporter.get_output_root(main_folder, output_override)
             path = exporter.write_subfolder_summary(output_root, folder_name, yearly)
-            self.append_log(f"Summary CSV written to: {path}\n")
+            self._post_log(f"Summary CSV written to: {path}\n")
         else:
-            self.append_log("Dry run: CSV summary not written.\n")
+            self._post_log("Dry run: CSV summary not written.\n")
 
-    def run_all_folders(self, main_folder: str, dry: bool, prefer_updates: bool):
-        self.append_log(
+    def run_all_folders(self, main_folder: str, dry: bool, prefer_updates: bool,
+                        output_override: str, max_workers: int,
+                        read_buffer_size: int):
+        # Worker thread: log through _post_log, never append_log
+        self._post_log(
             f"=== RUN ALL SUBFOLDERS ===\n"
             f"Dry run = {dry}\n"
             f"Prefer updates = {prefer_updates}\n"
             f"Main folder = {main_folder}\n"
         )
 
-        log_text, all_yearly = processor.process_all_subfolders(
-            main_folder, dry_run=dry, prefer_updates=prefer_updates
+        # Real runs keep a per-file totals cache next to the summaries, so
+        # the next run only re-parses CSVs that changed. Only the path here:
+        # creating Results before the scan would make it a "subfolder".
+        cache_path = None
+        if not dry:
+            cache_path = os.path.join(
+                exporter.output_root_path(main_folder, output_override),
+                processor.CACHE_FILENAME,
+            )
+
+        # The log streams in subfolder by subfolder through log=
+        _, all_yearly = processor.process_all_subfolders(
+            main_folder, dry_run=dry, prefer_updates=prefer_updates,
+            max_workers=max_workers, cache_path=cache_path,
+            progress=self._post_progress, log=self._post_log,
+            read_buffer_size=read_buffer_size, cancel=self._cancel,
         )
-        self.append_log(log_text)
 
         if not dry:
-            output_root = exporter.get_output_root(
-                main_folder, self.output_folder_var.get()
-            )
+            self._stop_if_cancelled()
+            output_root = exporter.get_output_root(main_folder, output_override)
             paths = exporter.write_all_summaries(output_root, all_yearly)
-            self.append_log("Summary CSVs written:\n" + "\n".join(paths) + "\n")
+            self._post_log("Summary CSVs written:\n" + "\n".join(paths) + "\n")
         else:
-            self.append_log("Dry run: no CSV summaries were written.\n")
+            self._post_log("Dry run: no CSV summaries were written.\n")
 
 
 if __name__ == "__main__":
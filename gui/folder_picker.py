@@ -0,0 +1,99 @@
+# folder_picker.py
+
+import os
+import tkinter as tk
+from tkinter import ttk
+
+
+class FolderPickerDialog(tk.Toplevel):
+    """
+    Modal folder chooser that lists a folder only when its node is expanded.
+
+    The native askdirectory dialog enumerates initialdir up front, which can
+    block the GUI for seconds on a big network share. Here each expand costs
+    one scandir of that folder.
+    """
+
+    def __init__(self, parent, title: str, initialdir: str):
+        super().__init__(parent)
+        self.title(title)
+        self.transient(parent)
+        self.geometry("420x480")
+
+        self.result = None  # chosen path, set by OK
+        self._paths = {}  # tree node id -> folder path
+        self._pending = set()  # node ids whose subfolders aren't listed yet
+
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+
+        self.tree = ttk.Treeview(tree_frame, show="tree", selectmode="browse")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<<TreeviewOpen>>", self._on_open)
+
+        tree_scroll = ttk.Scrollbar(
+            tree_frame, orient="vertical", command=self.tree.yview
+        )
+        tree_scroll.pack(side="right", fill="y")
+        self.tree.configure(yscrollcommand=tree_scroll.set)
+
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(fill="x", padx=10, pady=(0, 10))
+
+        ttk.Button(btn_frame, text="Cancel", command=self.destroy).pack(side="right")
+        ttk.Button(btn_frame, text="OK", command=self._on_ok).pack(
+            side="right", padx=(0, 5)
+        )
+
+        self.bind("<Return>", lambda event: self._on_ok())
+        self.bind("<Escape>", lambda event: self.destroy())
+
+        root = os.path.abspath(initialdir)
+        root_label = os.path.basename(root.rstrip("/\\")) or root
+        root_id = self._add_node("", root, root_label)
+        self._list_children(root_id)
+        self.tree.item(root_id, open=True)
+
+    @classmethod
+    def ask(cls, parent, title: str, initialdir: str):
+        """Show the dialog and wait; returns the chosen folder or None."""
+        dialog = cls(parent, title, initialdir)
+        dialog.wait_visibility()
+        dialog.grab_set()
+        dialog.wait_window()
+        return dialog.result
+
+    def _add_node(self, parent_id, path: str, label: str):
+        # One empty child keeps the expand arrow until the folder is listed
+        node_id = self.tree.insert(parent_id, "end", text=label, open=False)
+        self.tree.insert(node_id, "end", text="")
+        self._paths[node_id] = path
+        self._pending.add(node_id)
+        return node_id
+
+    def _list_children(self, node_id):
+        if node_id not in self._pending:
+            return  # already listed
+        self._pending.discard(node_id)
+        self.tree.delete(*self.tree.get_children(node_id))
+
+        try:
+            with os.scandir(self._paths[node_id]) as it:
+                subfolders = sorted(
+                    (entry.name, entry.path) for entry in it if entry.is_dir()
+                )
+        except OSError:
+            return  # unreadable folder: show it as empty
+
+        for name, path in subfolders:
+            self._add_node(node_id, path, name)
+
+    def _on_open(self, event=None):
+        self._list_children(self.tree.focus())
+
+    def _on_ok(self):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        self.result = self._paths[selection[0]]
+        self.destroy()